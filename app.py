@@ -1,13 +1,27 @@
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import httpx
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
 import json
-import xml.etree.ElementTree as ET
-from urllib.parse import urljoin, urlparse
+import hashlib
+import pathlib
+from functools import lru_cache
+from lxml import etree
+from urllib.parse import urljoin, urlparse, urlsplit
 import openai
+import numpy as np
+import tiktoken
 import re
-from typing import List, Dict, Any
+import string
+import threading
 import time
+from collections import defaultdict
+from typing import Callable, Iterable, List, Dict, Any, Optional, Tuple
+
+try:
+    import orjson as fast_json
+except ImportError:
+    fast_json = json
 
 # Configurazione della pagina
 st.set_page_config(
@@ -35,6 +49,177 @@ COMMON_STRUCTURED_DATA = {
     "WebSite": "Sito Web"
 }
 
+# Namespace delle sitemap XML e limite di URL estratti
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+SITEMAP_NAMESPACES = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+MAX_SITEMAP_URLS = 50
+MAX_SITEMAP_INDEX_DEPTH = 2  # Livelli di indici di sitemap seguiti
+
+# XPath precompilati per sitemap e indici di sitemap
+SITEMAP_URL_XPATH = etree.XPath('.//ns:url/ns:loc/text()', namespaces=SITEMAP_NAMESPACES)
+SITEMAP_INDEX_XPATH = etree.XPath('.//ns:sitemap/ns:loc/text()', namespaces=SITEMAP_NAMESPACES)
+
+# Opzioni del parser XML: niente entità, DTD o accessi di rete (XXE e billion laughs)
+SITEMAP_PARSER_OPTIONS = {
+    'resolve_entities': False,
+    'load_dtd': False,
+    'no_network': True,
+    'huge_tree': False
+}
+SITEMAP_XML_PARSER = etree.XMLParser(**SITEMAP_PARSER_OPTIONS)
+
+# Oltre questa dimensione (o se sconosciuta) la sitemap viene letta in streaming
+SITEMAP_STREAM_THRESHOLD = 1_000_000
+
+# Modelli OpenAI selezionabili (il primo è il predefinito, tutti supportano la
+# modalità JSON) e cache delle risposte
+OPENAI_MODELS = ["gpt-4o-mini", "gpt-4o", "gpt-4-turbo"]
+DEFAULT_MODEL = OPENAI_MODELS[0]
+OPENAI_CACHE_DIR = pathlib.Path('.cache/openai')
+
+# Token massimi per ciascun campo della pagina inserito nel prompt di generazione
+PROMPT_TOKEN_BUDGETS = {
+    'title': 40,
+    'meta_description': 120,
+    'headings': 300,
+    'images': 200
+}
+
+CHARS_PER_TOKEN = 4  # Stima usata se il tokenizer non è disponibile
+
+# Prompt per i suggerimenti: solo l'elenco delle pagine cambia tra una richiesta e l'altra
+SUGGEST_PROMPT = string.Template("""Suggerisci i migliori tipi di dati strutturati Schema.org per queste pagine web (una per riga, formato URL|tipo rilevato|titolo|primo heading):
+
+$pages
+
+Considera efficacia SEO, compatibilità con Google Rich Snippets e best practice di Schema.org.
+Rispondi in JSON: {"suggestions": [{"schema_type": "Product", "pages": ["url1"], "reason": "Motivo della raccomandazione", "priority": "high|medium|low"}]}""")
+
+# Classificazione locale delle pagine tramite embedding
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_MIN_MARGIN = 0.05  # Sotto questo margine tra i due schemi migliori decide GPT
+
+# Scraping parallelo: connessioni HTTP e frequenza delle richieste per singolo host
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+HOST_MAX_RPS = 4.0
+HOST_MIN_RPS = 1.0
+HOST_MAX_RETRIES = 2  # Nuovi tentativi dopo una risposta 429
+HOST_MAX_RETRY_AFTER = 5  # Secondi: oltre questa attesa la pagina viene abbandonata
+HOST_MAX_IN_FLIGHT = 4  # Richieste contemporanee verso lo stesso host in un batch
+
+# Dimensione massima dell'HTML analizzato: head, headings e JSON-LD stanno ampiamente nel limite
+MAX_PAGE_BYTES = 2_000_000
+PAGE_CHUNK_SIZE = 65536
+
+def _select_html_parser() -> str:
+    """Sceglie il parser HTML più veloce disponibile per BeautifulSoup"""
+    for parser in ('lxml', 'html5lib'):
+        try:
+            BeautifulSoup('', parser)
+            return parser
+        except FeatureNotFound:
+            continue
+    return 'html.parser'
+
+HTML_PARSER = _select_html_parser()
+
+# Solo i tag effettivamente letti durante l'analisi vengono inseriti nell'albero
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+HEADING_LEVELS = {tag: int(tag[1]) for tag in HEADING_TAGS}
+MAX_JSON_LD_BLOCKS = 20
+PAGE_TAGS = ['title', 'meta', *HEADING_TAGS, 'img', 'script']
+
+# Tag le cui classi servono a rilevare il tipo di contenuto
+CLASS_TAGS = ['div', 'span', 'article']
+
+class PageStrainer(SoupStrainer):
+    """Filtro di parsing: tag letti dall'analisi più div/span/article con attributo class"""
+    
+    def __init__(self):
+        super().__init__(PAGE_TAGS + CLASS_TAGS)
+    
+    @staticmethod
+    def _keep(name: str, attrs) -> bool:
+        return name in PAGE_TAGS or (name in CLASS_TAGS and 'class' in (attrs or {}))
+    
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # BeautifulSoup < 4.13 durante il parsing passa nome e attributi del tag
+        if isinstance(markup_name, str):
+            return markup_name if self._keep(markup_name, markup_attrs) else None
+        return super().search_tag(markup_name, markup_attrs)
+    
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        # BeautifulSoup >= 4.13
+        return self._keep(name, attrs)
+
+PAGE_STRAINER = PageStrainer()
+
+# Tipi di contenuto in ordine di priorità: il bit i corrisponde a CONTENT_TYPES[i]
+CONTENT_TYPES = ['product', 'article', 'event', 'local_business']
+
+# Un pattern per tipo, nello stesso ordine di CONTENT_TYPES: ogni tag viene confrontato
+# solo con i tipi che può segnalare, così una corrispondenza esclusa non ne nasconde altre
+CONTENT_TYPE_PATTERNS = [
+    re.compile(r'price|prezzo', re.I),
+    re.compile(r'article|post|blog', re.I),
+    re.compile(r'event|evento|data', re.I),
+    re.compile(r'address|indirizzo|contact', re.I)
+]
+
+# Tipi di contenuto che ciascun tag può segnalare
+TAG_CONTENT_TYPE_MASK = {
+    'div': 0b1111,
+    'span': 0b1101,
+    'article': 0b0010
+}
+
+@lru_cache(maxsize=512)
+def parse_json_ld(raw: str) -> Any:
+    """Decodifica un blocco JSON-LD, riusando il risultato per blocchi identici.
+    
+    Il risultato è condiviso tra le chiamate: va trattato come sola lettura.
+    """
+    return fast_json.loads(raw)
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """Restituisce il tokenizer del modello, caricato una sola volta.
+    
+    Anche il fallimento resta in cache (None): il download dei file BPE di tiktoken
+    non ha timeout e non va ritentato a ogni generazione.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None  # Si tronca per caratteri
+
+def fit_tokens(text: str, budget: int, encoding: Optional[tiktoken.Encoding]) -> str:
+    """Tronca il testo al numero massimo di token indicato"""
+    if encoding is None:
+        # Tokenizer non disponibile: stima approssimativa in caratteri
+        return text[:budget * CHARS_PER_TOKEN]
+    
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= budget:
+        return text
+    return encoding.decode(tokens[:budget])
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normalizza ogni riga a norma unitaria per il calcolo della similarità coseno"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+@st.cache_resource(show_spinner=False)
+def load_schema_embeddings(_client: openai.OpenAI, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """Calcola una sola volta gli embedding dei tipi di dati strutturati supportati"""
+    inputs = [f"{schema} {label}" for schema, label in COMMON_STRUCTURED_DATA.items()]
+    response = _client.embeddings.create(model=model, input=inputs)
+    return normalize_rows(np.array([item.embedding for item in response.data]))
+
 class SchemaOrgAnalyzer:
     """Classe per analizzare e suggerire dati strutturati basati su Schema.org"""
     
@@ -70,105 +255,291 @@ class SchemaOrgAnalyzer:
             }
         }
 
+class HostLimiter:
+    """Limita la frequenza delle richieste per host, adattandola alle risposte 429.
+    
+    L'istanza è condivisa tra sessioni (thread diversi, ognuno col proprio event loop):
+    lo stato viene letto e aggiornato solo sotto lock.
+    """
+    
+    def __init__(self, max_rps: float = HOST_MAX_RPS, min_rps: float = HOST_MIN_RPS):
+        self.max_rps = max_rps
+        self.min_rps = min_rps
+        self.rates = {}
+        self.next_slot = {}
+        self.lock = threading.Lock()
+    
+    async def wait(self, host: str):
+        """Attende il prossimo turno disponibile per l'host"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + 1.0 / self.rates.get(host, self.max_rps)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    def record(self, host: str, response: httpx.Response) -> bool:
+        """Aggiorna la frequenza dell'host e indica se conviene ritentare la richiesta"""
+        with self.lock:
+            rate = self.rates.get(host, self.max_rps)
+            if response.status_code != 429:
+                if rate < self.max_rps:
+                    self.rates[host] = min(self.max_rps, rate + 0.5)
+                return False
+            
+            # Dimezza la frequenza e rispetta Retry-After, se indicato in secondi e breve
+            self.rates[host] = max(self.min_rps, rate * 0.5)
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                if int(retry_after) > HOST_MAX_RETRY_AFTER:
+                    return False
+                self.next_slot[host] = max(self.next_slot.get(host, 0.0),
+                                           time.monotonic() + int(retry_after))
+            return True
+
 class WebScraper:
     """Classe per il web scraping e l'analisi delle pagine"""
     
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.client = httpx.Client(**self._client_options())
+        self.limiter = HostLimiter()
     
-    def scrape_sitemap(self, sitemap_url: str) -> List[str]:
-        """Estrae gli URL da una sitemap XML"""
+    @staticmethod
+    def _client_options() -> Dict[str, Any]:
+        """Opzioni comuni ai client HTTP/2 sincrono e asincrono"""
+        return {
+            'http2': True,
+            'headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            },
+            'timeout': 10.0,
+            'follow_redirects': True,
+            'limits': httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            )
+        }
+    
+    def scrape_sitemap(self, sitemap_url: str, limit: int = MAX_SITEMAP_URLS,
+                       visited: Optional[set] = None, depth: int = 0) -> List[str]:
+        """Estrae gli URL da una sitemap XML (o da un indice di sitemap)"""
+        # Evita di scaricare due volte la stessa sitemap (indici che si citano a vicenda)
+        visited = set() if visited is None else visited
+        visited.add(sitemap_url)
+        
         try:
-            response = self.session.get(sitemap_url, timeout=10)
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            urls = []
-            
-            # Gestisce namespace XML
-            namespaces = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+            with self.client.stream('GET', sitemap_url) as response:
+                response.raise_for_status()
+                
+                # Sitemap piccole: parsing completo e XPath precompilati. Con gzip & co.
+                # Content-Length è la dimensione compressa e non dice quanto pesa l'XML
+                length = int(response.headers.get('Content-Length') or 0)
+                encoded = response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+                if 0 < length <= SITEMAP_STREAM_THRESHOLD and not encoded:
+                    root = etree.fromstring(response.read(), parser=SITEMAP_XML_PARSER)
+                    urls = [loc.strip() for loc in SITEMAP_URL_XPATH(root) if loc.strip()][:limit]
+                    child_sitemaps = [loc.strip() for loc in SITEMAP_INDEX_XPATH(root) if loc.strip()]
+                else:
+                    urls, child_sitemaps = self._iterparse_sitemap(response.iter_bytes(), limit)
             
-            for url in root.findall('.//ns:url/ns:loc', namespaces):
-                if url.text:
-                    urls.append(url.text.strip())
+            # Indice di sitemap: segue le sitemap figlie fino al limite
+            if depth < MAX_SITEMAP_INDEX_DEPTH:
+                for child_url in child_sitemaps:
+                    if len(urls) >= limit:
+                        break
+                    if child_url in visited:
+                        continue
+                    urls.extend(self.scrape_sitemap(child_url, limit - len(urls), visited, depth + 1))
             
-            return urls[:50]  # Limita a 50 URL per performance
+            return urls[:limit]  # Limita a 50 URL per performance
             
         except Exception as e:
             st.error(f"Errore nel parsing della sitemap: {str(e)}")
             return []
     
+    def _iterparse_sitemap(self, chunks: Iterable[bytes], limit: int) -> Tuple[List[str], List[str]]:
+        """Legge una sitemap in streaming, restituendo URL e sitemap figlie"""
+        urls = []
+        child_sitemaps = []
+        
+        # Parsing incrementale: gli elementi già letti vengono liberati
+        # e ci si ferma appena raggiunto il limite
+        parser = etree.XMLPullParser(events=('end',), tag=(SITEMAP_NS + 'url', SITEMAP_NS + 'sitemap'),
+                                     **SITEMAP_PARSER_OPTIONS)
+        for chunk in chunks:
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                loc = elem.findtext(SITEMAP_NS + 'loc')
+                if loc and loc.strip():
+                    if elem.tag == SITEMAP_NS + 'url':
+                        urls.append(loc.strip())
+                    else:
+                        child_sitemaps.append(loc.strip())
+                
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+                
+                if len(urls) >= limit:
+                    return urls, child_sitemaps
+        
+        return urls, child_sitemaps
+    
     def scrape_page(self, url: str) -> Dict[str, Any]:
         """Estrae informazioni da una singola pagina"""
-        try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Estrae informazioni base
-            page_info = {
-                'url': url,
-                'title': soup.title.string.strip() if soup.title else '',
-                'meta_description': '',
-                'headings': [],
-                'images': [],
-                'links': [],
-                'content_type': self._detect_content_type(soup),
-                'structured_data': self._extract_existing_structured_data(soup)
-            }
-            
-            # Meta description
-            meta_desc = soup.find('meta', attrs={'name': 'description'})
-            if meta_desc:
-                page_info['meta_description'] = meta_desc.get('content', '')
-            
-            # Headings
-            for i in range(1, 7):
-                headings = soup.find_all(f'h{i}')
-                for h in headings[:5]:  # Max 5 per livello
-                    page_info['headings'].append({
-                        'level': i,
-                        'text': h.get_text().strip()
-                    })
+        return self.scrape_pages([url])[0]
+    
+    def scrape_pages(self, urls: List[str],
+                     on_progress: Optional[Callable[[float], Any]] = None) -> List[Dict[str, Any]]:
+        """Estrae in parallelo le informazioni da più pagine, nell'ordine ricevuto"""
+        if not urls:
+            return []
+        
+        return asyncio.run(self._scrape_pages_async(urls, on_progress))
+    
+    async def _scrape_pages_async(self, urls: List[str],
+                                  on_progress: Optional[Callable[[float], Any]]) -> List[Dict[str, Any]]:
+        """Scarica le pagine su un unico client HTTP/2 condiviso"""
+        # Un semaforo per host, legato all'event loop di questo batch
+        in_flight = defaultdict(lambda: asyncio.Semaphore(HOST_MAX_IN_FLIGHT))
+        async with httpx.AsyncClient(**self._client_options()) as client:
+            tasks = [asyncio.ensure_future(self._scrape_page_async(client, url, in_flight))
+                     for url in urls]
             
-            # Immagini
-            images = soup.find_all('img')
-            for img in images[:10]:  # Max 10 immagini
-                src = img.get('src')
-                if src:
-                    page_info['images'].append({
-                        'src': urljoin(url, src),
-                        'alt': img.get('alt', ''),
-                        'title': img.get('title', '')
-                    })
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                await task
+                if on_progress:
+                    on_progress(done / len(tasks))
             
-            return page_info
+            return [task.result() for task in tasks]
+    
+    async def _scrape_page_async(self, client: httpx.AsyncClient, url: str,
+                                 in_flight: Dict[str, asyncio.Semaphore]) -> Dict[str, Any]:
+        """Scarica e analizza una singola pagina"""
+        try:
+            async with in_flight[urlparse(url).netloc]:
+                content, encoding = await self._fetch_page(client, url)
+            return self._parse_page(url, content, encoding)
             
         except Exception as e:
             st.error(f"Errore nello scraping di {url}: {str(e)}")
             return {'url': url, 'error': str(e)}
     
-    def _detect_content_type(self, soup: BeautifulSoup) -> str:
-        """Rileva il tipo di contenuto della pagina"""
-        # Rileva prodotti
-        if soup.find_all(['div', 'span'], class_=re.compile(r'price|prezzo', re.I)):
-            return 'product'
+    async def _fetch_page(self, client: httpx.AsyncClient, url: str) -> Tuple[bytes, Optional[str]]:
+        """Scarica in streaming al massimo MAX_PAGE_BYTES dell'HTML di una pagina"""
+        host = urlparse(url).netloc
+        for attempt in range(HOST_MAX_RETRIES + 1):
+            await self.limiter.wait(host)
+            async with client.stream('GET', url) as response:
+                if self.limiter.record(host, response) and attempt < HOST_MAX_RETRIES:
+                    continue
+                response.raise_for_status()
+                
+                chunks = []
+                total = 0
+                async for chunk in response.aiter_bytes(PAGE_CHUNK_SIZE):
+                    chunks.append(chunk)
+                    total += len(chunk)
+                    if total >= MAX_PAGE_BYTES:
+                        break
+                
+                return b''.join(chunks)[:MAX_PAGE_BYTES], response.charset_encoding
+    
+    def _parse_page(self, url: str, content: bytes, encoding: Optional[str]) -> Dict[str, Any]:
+        """Estrae le informazioni dall'HTML di una pagina"""
+        # Usa l'encoding solo se dichiarato dal server, altrimenti lo rileva BS4
+        soup = BeautifulSoup(content, HTML_PARSER,
+                             from_encoding=encoding, parse_only=PAGE_STRAINER)
+        
+        # Estrae informazioni base
+        page_info = {
+            'url': url,
+            'title': soup.title.string.strip() if soup.title else '',
+            'meta_description': '',
+            'headings': [],
+            'images': [],
+            'links': [],
+            'content_type': self._detect_content_type(soup),
+            'structured_data': self._extract_existing_structured_data(soup)
+        }
+        
+        # Meta description
+        meta_desc = soup.find('meta', attrs={'name': 'description'})
+        if meta_desc:
+            page_info['meta_description'] = meta_desc.get('content', '')
+        
+        # Headings
+        page_info['headings'] = self.extract_headings(soup, per_level=5)  # Max 5 per livello
+        
+        # Immagini
+        resolve = self._url_resolver(url)
+        page_info['images'] = [
+            {
+                'src': resolve(img['src']),
+                'alt': img.get('alt', ''),
+                'title': img.get('title', '')
+            }
+            for img in soup.find_all('img', limit=10)  # Max 10 immagini
+            if img.get('src')
+        ]
+        
+        return page_info
+    
+    @staticmethod
+    def _url_resolver(base_url: str) -> Callable[[str], str]:
+        """Crea una funzione che risolve gli URL rispetto a una pagina già analizzata"""
+        scheme = urlsplit(base_url).scheme
         
-        # Rileva articoli
-        if soup.find_all(['article', 'div'], class_=re.compile(r'article|post|blog', re.I)):
-            return 'article'
+        def resolve(src: str) -> str:
+            # URL assoluti e relativi al protocollo non richiedono urljoin
+            if src.startswith(('http://', 'https://')):
+                return src
+            if src.startswith('//'):
+                return f"{scheme}:{src}"
+            return urljoin(base_url, src)
         
-        # Rileva eventi
-        if soup.find_all(['div', 'span'], class_=re.compile(r'event|evento|data', re.I)):
-            return 'event'
+        return resolve
+    
+    @staticmethod
+    def extract_headings(soup: BeautifulSoup, per_level: int) -> List[Dict[str, Any]]:
+        """Estrae gli headings h1..h6 con una sola visita del documento"""
+        by_level = defaultdict(list)
+        remaining = per_level * len(HEADING_TAGS)
         
-        # Rileva business locali
-        if soup.find_all(['div', 'span'], class_=re.compile(r'address|indirizzo|contact', re.I)):
-            return 'local_business'
+        # Visita lazy: si interrompe appena tutti i livelli sono completi
+        for node in soup.descendants:
+            level = HEADING_LEVELS.get(node.name)
+            if level and len(by_level[level]) < per_level:
+                by_level[level].append(node)
+                remaining -= 1
+                if not remaining:
+                    break
+        
+        return [
+            {'level': level, 'text': h.get_text().strip()}
+            for level in range(1, 7)
+            for h in by_level[level]
+        ]
+    
+    def _detect_content_type(self, soup: BeautifulSoup) -> str:
+        """Rileva il tipo di contenuto della pagina dalle classi dei tag"""
+        # Un'unica visita dei tag con classe, accumulando i tipi trovati in una bitmask
+        found = 0
+        for tag in soup.find_all(CLASS_TAGS, class_=True):
+            # Solo i tipi consentiti al tag e non ancora trovati
+            pending = TAG_CONTENT_TYPE_MASK[tag.name] & ~found
+            classes = ' '.join(tag.get('class') or ())
+            for i, pattern in enumerate(CONTENT_TYPE_PATTERNS):
+                if pending >> i & 1 and pattern.search(classes):
+                    found |= 1 << i
+            
+            # Il tipo a priorità massima non può essere superato
+            if found & 1:
+                return CONTENT_TYPES[0]
+        
+        if found:
+            # Il bit meno significativo è il tipo a priorità più alta
+            return CONTENT_TYPES[(found & -found).bit_length() - 1]
         
         return 'webpage'
     
@@ -177,15 +548,16 @@ class WebScraper:
         structured_data = []
         
         # JSON-LD
-        json_ld_scripts = soup.find_all('script', type='application/ld+json')
+        json_ld_scripts = soup.find_all('script', type='application/ld+json', limit=MAX_JSON_LD_BLOCKS)
         for script in json_ld_scripts:
             try:
-                data = json.loads(script.string)
+                # orjson rifiuta le sottoclassi di str come NavigableString
+                data = parse_json_ld(str(script.string or script.get_text()))
                 structured_data.append({
                     'type': 'json-ld',
                     'data': data
                 })
-            except:
+            except (ValueError, TypeError):
                 pass
         
         return structured_data
@@ -193,66 +565,182 @@ class WebScraper:
 class StructuredDataGenerator:
     """Classe per generare dati strutturati usando OpenAI"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, model: str = DEFAULT_MODEL):
         self.client = openai.OpenAI(api_key=api_key)
+        self.model = model
+    
+    def _cache_key(self, *parts: Any) -> str:
+        """Calcola una chiave stabile per la cache a partire da modello e input"""
+        payload = json.dumps([self.model, *parts], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _complete(self, prompt: str, cache_key: str, force: bool = False, **kwargs) -> Tuple[str, bool]:
+        """Esegue una chat completion in streaming, riusando la risposta salvata su disco se presente.
+        
+        Restituisce il testo e se la risposta è stata troncata dal limite di token.
+        """
+        cache_file = OPENAI_CACHE_DIR / cache_key
+        if not force and cache_file.exists():
+            return cache_file.read_text(encoding='utf-8'), False
+        
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **kwargs
+        )
+        
+        # Mostra l'output man mano che arriva
+        placeholder = st.empty()
+        content = ""
+        finish_reason = None
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].delta.content:
+                content += chunk.choices[0].delta.content
+                placeholder.code(content, language="json")
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+        placeholder.empty()
+        
+        return content, finish_reason == "length"
     
-    def suggest_structured_data(self, pages_info: List[Dict]) -> Dict[str, List[str]]:
+    def _store(self, cache_key: str, content: str):
+        """Salva su disco una risposta valida di OpenAI"""
+        OPENAI_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (OPENAI_CACHE_DIR / cache_key).write_text(content, encoding='utf-8')
+    
+    def suggest_structured_data(self, pages_info: List[Dict], force: bool = False) -> Dict[str, List[str]]:
         """Suggerisce tipi di dati strutturati basandosi sull'analisi delle pagine"""
+        valid_pages = [page for page in pages_info if 'error' not in page]
+        
+        # Embedding: ogni pagina viene confrontata con gli schemi supportati; il tipo
+        # di contenuto rilevato dall'HTML è solo un indizio nel testo confrontato
+        matches = defaultdict(list)
+        ambiguous = valid_pages
+        if valid_pages:
+            try:
+                ambiguous = self._classify_with_embeddings(valid_pages, matches)
+            except openai.OpenAIError:
+                pass  # Senza embedding decide GPT su tutte le pagine
+        
+        suggestions = [
+            {
+                "schema_type": schema,
+                "pages": urls,
+                "reason": reason,
+                "priority": self._priority(len(urls), len(valid_pages))
+            }
+            for (schema, reason), urls in matches.items()
+        ]
         
-        # Prepara il prompt per OpenAI
-        pages_summary = []
-        for page in pages_info[:5]:  # Analizza max 5 pagine
-            if 'error' not in page:
-                summary = f"URL: {page['url']}\nTitolo: {page['title']}\nTipo: {page['content_type']}\nHeadings: {[h['text'] for h in page['headings'][:3]]}"
-                pages_summary.append(summary)
-        
-        prompt = f"""Analizza queste pagine web e suggerisci i migliori tipi di dati strutturati Schema.org da implementare:
-
-{chr(10).join(pages_summary)}
-
-Fornisci suggerimenti specifici per ogni tipo di pagina identificata, considerando:
-1. I tipi di dati strutturati più efficaci per la SEO
-2. La compatibilità con Google Rich Snippets
-3. Le best practice di Schema.org
-
-Rispondi in formato JSON con questa struttura:
-{{
-    "suggestions": [
-        {{
-            "schema_type": "Product",
-            "pages": ["url1", "url2"],
-            "reason": "Motivo della raccomandazione",
-            "priority": "high|medium|low"
-        }}
-    ]
-}}"""
+        result = {"suggestions": suggestions}
+        
+        # GPT solo per le pagine che la classificazione locale non separa con certezza
+        if ambiguous:
+            gpt_result = self._suggest_with_gpt(ambiguous, force=force)
+            suggestions.extend(gpt_result.get("suggestions", []))
+            if 'error' in gpt_result:
+                result['error'] = gpt_result['error']
+        
+        return result
+    
+    def _classify_with_embeddings(self, pages: List[Dict], matches: Dict) -> List[Dict]:
+        """Assegna le pagine allo schema più simile e restituisce quelle ambigue"""
+        schema_vecs = load_schema_embeddings(self.client)
+        schema_names = list(COMMON_STRUCTURED_DATA)
+        
+        # Un'unica richiesta per tutte le pagine
+        texts = [
+            f"{page['title']} {page['content_type']} {' '.join(h['text'] for h in page['headings'][:3])}"
+            for page in pages
+        ]
+        response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+        page_vecs = normalize_rows(np.array([item.embedding for item in response.data]))
+        
+        scores = np.einsum('ij,kj->ik', page_vecs, schema_vecs)
+        top_two = np.sort(scores, axis=1)[:, -2:]
+        margins = top_two[:, 1] - top_two[:, 0]
+        
+        ambiguous = []
+        for page, best, margin in zip(pages, scores.argmax(axis=1), margins):
+            if margin < EMBEDDING_MIN_MARGIN:
+                ambiguous.append(page)
+                continue
+            schema = schema_names[best]
+            reason = f"Contenuto semanticamente affine a {COMMON_STRUCTURED_DATA[schema]}"
+            matches[(schema, reason)].append(page['url'])
+        
+        return ambiguous
+    
+    @staticmethod
+    def _priority(matched: int, total: int) -> str:
+        """Calcola la priorità in base alla quota di pagine coinvolte"""
+        share = matched / total if total else 0
+        if share >= 0.5:
+            return 'high'
+        if share >= 0.2:
+            return 'medium'
+        return 'low'
+    
+    def _suggest_with_gpt(self, pages_info: List[Dict], force: bool = False) -> Dict[str, List[str]]:
+        """Chiede a OpenAI i tipi di dati strutturati per le pagine indicate"""
+        
+        # Prepara il prompt per OpenAI: una riga compatta per pagina, ordinate per URL prima
+        # di scegliere le 5 da analizzare, così che l'ordine di analisi non cambi il prompt
+        # né la chiave di cache
+        pages = sorted(pages_info, key=lambda page: page['url'])[:5]  # Analizza max 5 pagine
+        prompt = SUGGEST_PROMPT.substitute(pages="\n".join(
+            f"{page['url']}|{page['content_type']}|{page['title'][:80]}|"
+            f"{page['headings'][0]['text'][:80] if page['headings'] else ''}"
+            for page in pages
+        ))
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
+            # La chiave copre l'intero prompt: template, titoli e headings inclusi
+            cache_key = self._cache_key('suggest', prompt)
+            content, truncated = self._complete(
+                prompt, cache_key, force=force,
+                temperature=0.3,
+                response_format={"type": "json_object"}
             )
+            if truncated:
+                raise ValueError("risposta troncata dal limite di token")
             
-            result = json.loads(response.choices[0].message.content)
+            result = json.loads(content)
+            self._store(cache_key, content)
             return result
             
         except Exception as e:
             st.error(f"Errore nella generazione dei suggerimenti: {str(e)}")
-            return {"suggestions": []}
+            return {"suggestions": [], "error": str(e)}
     
-    def generate_structured_data(self, page_info: Dict, schema_type: str, custom_schema: str = None) -> str:
+    def generate_structured_data(self, page_info: Dict, schema_type: str, custom_schema: str = None,
+                                 force: bool = False) -> str:
         """Genera dati strutturati per una pagina specifica"""
         
         schema_to_use = custom_schema if custom_schema else schema_type
         
+        # Limita i campi della pagina perché il prompt resti entro il budget di token
+        encoding = get_encoding(self.model)
+        fields = {
+            'title': page_info['title'],
+            'meta_description': page_info.get('meta_description', ''),
+            'headings': str(page_info.get('headings', [])),
+            'images': str(page_info.get('images', []))
+        }
+        fields = {
+            name: fit_tokens(value, PROMPT_TOKEN_BUDGETS[name], encoding)
+            for name, value in fields.items()
+        }
+        
         prompt = f"""Genera dati strutturati JSON-LD ottimizzati per SEO utilizzando lo schema "{schema_to_use}" per questa pagina:
 
 URL: {page_info['url']}
-Titolo: {page_info['title']}
-Meta Description: {page_info.get('meta_description', '')}
-Headings: {page_info.get('headings', [])}
-Immagini: {page_info.get('images', [])}
+Titolo: {fields['title']}
+Meta Description: {fields['meta_description']}
+Headings: {fields['headings']}
+Immagini: {fields['images']}
 
 Requisiti:
 1. Utilizza il formato JSON-LD
@@ -265,17 +753,204 @@ Requisiti:
 Genera un JSON-LD completo e valido."""
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
+            cache_key = self._cache_key('generate', prompt)
+            content, truncated = self._complete(
+                prompt, cache_key, force=force,
+                temperature=0.2,
+                max_tokens=1024
             )
-            
-            return response.choices[0].message.content
-            
         except Exception as e:
             st.error(f"Errore nella generazione dei dati strutturati: {str(e)}")
             return ""
+        
+        # Un JSON-LD troncato da max_tokens viene mostrato ma non salvato in nessuna cache
+        if truncated:
+            st.warning("⚠️ Il JSON-LD generato è stato troncato dal limite di token e potrebbe essere incompleto")
+            raise UncachedResult(content)
+        
+        if content:
+            self._store(cache_key, content)
+        return content
+
+@st.cache_resource
+def get_scraper() -> WebScraper:
+    """Scraper condiviso tra i rerun, così da riusare le connessioni HTTP"""
+    return WebScraper()
+
+# Cache tra i rerun di Streamlit: `bust` cambia quando l'utente svuota la cache.
+# Le funzioni memorizzate sollevano UncachedResult sugli esiti falliti, che così
+# non restano in cache e vengono ritentati al rerun successivo.
+
+class UncachedResult(Exception):
+    """Esito da restituire senza memorizzarlo in cache"""
+    
+    def __init__(self, value: Any):
+        super().__init__()
+        self.value = value
+
+def without_failures(cached_func: Callable, *args) -> Any:
+    """Chiama una funzione memorizzata restituendo anche gli esiti non memorizzati"""
+    try:
+        return cached_func(*args)
+    except UncachedResult as e:
+        return e.value
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
+def _cached_sitemap(sitemap_url: str, bust: int = 0) -> List[str]:
+    """Sitemap memorizzata solo se contiene URL"""
+    urls = get_scraper().scrape_sitemap(sitemap_url)
+    if not urls:
+        raise UncachedResult(urls)
+    return urls
+
+# Segnaposto per _cached_page: la chiamata legge la cache senza scaricare la pagina
+PAGE_MISS = object()
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
+def _cached_page(url: str, bust: int = 0, _page_info: Any = None) -> Dict[str, Any]:
+    """Pagina memorizzata solo se lo scraping è riuscito.
+    
+    `_page_info` non fa parte della chiave: con una pagina già scaricata in batch la
+    memorizza senza scaricarla di nuovo, con PAGE_MISS restituisce None se manca.
+    """
+    if _page_info is PAGE_MISS:
+        raise UncachedResult(None)
+    page_info = get_scraper().scrape_page(url) if _page_info is None else _page_info
+    if 'error' in page_info:
+        raise UncachedResult(page_info)
+    return page_info
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _cached_suggestions(_generator: StructuredDataGenerator, model: str,
+                        pages_info: List[Dict], bust: int = 0) -> Dict[str, List[str]]:
+    """Suggerimenti memorizzati solo in assenza di errori OpenAI"""
+    suggestions = _generator.suggest_structured_data(pages_info)
+    if 'error' in suggestions:
+        raise UncachedResult(suggestions)
+    return suggestions
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _cached_structured_data(_generator: StructuredDataGenerator, model: str, page_info: Dict,
+                            schema_type: str, custom_schema: str = None, bust: int = 0) -> str:
+    """JSON-LD memorizzato solo se la generazione ha prodotto output completo"""
+    structured_data = _generator.generate_structured_data(page_info, schema_type, custom_schema)
+    if not structured_data:
+        raise UncachedResult(structured_data)
+    return structured_data
+
+def cached_sitemap(sitemap_url: str, bust: int = 0) -> List[str]:
+    """Versione memorizzata di WebScraper.scrape_sitemap"""
+    return without_failures(_cached_sitemap, sitemap_url, bust)
+
+def cached_page(url: str, bust: int = 0) -> Dict[str, Any]:
+    """Versione memorizzata di WebScraper.scrape_page"""
+    return without_failures(_cached_page, url, bust)
+
+def cached_pages(urls: Tuple[str, ...], bust: int = 0) -> List[Dict[str, Any]]:
+    """Versione memorizzata di WebScraper.scrape_pages, con barra di avanzamento"""
+    # Ogni pagina ha la sua voce in cache: solo quelle mancanti vengono scaricate, in un unico batch
+    pages = {url: without_failures(_cached_page, url, bust, PAGE_MISS) for url in urls}
+    misses = [url for url, page_info in pages.items() if page_info is None]
+    if misses:
+        progress_bar = st.progress(0)
+        scraped = get_scraper().scrape_pages(misses, on_progress=progress_bar.progress)
+        progress_bar.empty()
+        for url, page_info in zip(misses, scraped):
+            pages[url] = without_failures(_cached_page, url, bust, page_info)
+    return [pages[url] for url in urls]
+
+def get_suggestions(generator: StructuredDataGenerator, pages_info: List[Dict],
+                    force: bool = False, bust: int = 0) -> Dict[str, List[str]]:
+    """Restituisce i suggerimenti, ignorando tutte le cache se richiesto"""
+    if force:
+        return generator.suggest_structured_data(pages_info, force=True)
+    return without_failures(_cached_suggestions, generator, generator.model, pages_info, bust)
+
+def get_structured_data(generator: StructuredDataGenerator, page_info: Dict, schema_type: str,
+                        custom_schema: str = None, force: bool = False, bust: int = 0) -> str:
+    """Restituisce i dati strutturati, ignorando tutte le cache se richiesto"""
+    if force:
+        return without_failures(generator.generate_structured_data,
+                                page_info, schema_type, custom_schema, True)
+    return without_failures(_cached_structured_data, generator, generator.model,
+                            page_info, schema_type, custom_schema, bust)
+
+PRIORITY_ICONS = {
+    'high': '🔴',
+    'medium': '🟡',
+    'low': '🟢'
+}
+
+@st.fragment
+def render_suggestions(suggestions: Dict[str, List[str]]):
+    """Mostra i suggerimenti di dati strutturati"""
+    if not suggestions.get('suggestions'):
+        return
+    
+    st.subheader("📋 Suggerimenti Dati Strutturati")
+    
+    for suggestion in suggestions['suggestions']:
+        priority = suggestion.get('priority', 'medium')
+        priority_color = PRIORITY_ICONS.get(priority, '🟡')
+        
+        with st.expander(f"{priority_color} {suggestion['schema_type']} - Priorità: {priority}"):
+            st.write(f"**Motivo:** {suggestion['reason']}")
+            if suggestion.get('pages'):
+                st.write("**Pagine coinvolte:**")
+                for page_url in suggestion['pages']:
+                    st.write(f"- {page_url}")
+
+@st.fragment
+def analysis_section(generator: StructuredDataGenerator, ignore_cache: bool, bust: int):
+    """Analisi del sito: le interazioni rieseguono solo questa sezione"""
+    st.header("Analisi Sito e Suggerimenti")
+    st.markdown("Analizza il tuo sito per ricevere suggerimenti sui migliori dati strutturati da implementare.")
+    
+    # Input methods
+    input_method = st.radio(
+        "Scegli il metodo di analisi:",
+        ["Sitemap XML", "URL Specifici", "Codice Sorgente"]
+    )
+    
+    if input_method == "Sitemap XML":
+        sitemap_url = st.text_input("URL della Sitemap", placeholder="https://esempio.com/sitemap.xml")
+        
+        if st.button("Analizza Sitemap", type="primary"):
+            if sitemap_url:
+                with st.spinner("Analizzando la sitemap..."):
+                    urls = cached_sitemap(sitemap_url, bust)
+                    
+                    if urls:
+                        st.success(f"Trovati {len(urls)} URL nella sitemap")
+                        
+                        # Analizza le prime pagine
+                        pages_info = cached_pages(tuple(urls[:10]), bust)  # Analizza max 10 pagine
+                        
+                        # Genera suggerimenti
+                        with st.spinner("Generando suggerimenti..."):
+                            suggestions = get_suggestions(generator, pages_info, force=ignore_cache, bust=bust)
+                        
+                        # Mostra risultati
+                        render_suggestions(suggestions)
+    
+    elif input_method == "URL Specifici":
+        urls_input = st.text_area(
+            "Inserisci gli URL da analizzare (uno per riga)",
+            placeholder="https://esempio.com/prodotto1\nhttps://esempio.com/articolo1"
+        )
+        
+        if st.button("Analizza URL", type="primary"):
+            if urls_input:
+                urls = [url.strip() for url in urls_input.split('\n') if url.strip()]
+                
+                with st.spinner("Analizzando le pagine..."):
+                    pages_info = cached_pages(tuple(urls), bust)
+                    
+                    # Genera suggerimenti
+                    suggestions = get_suggestions(generator, pages_info, force=ignore_cache, bust=bust)
+                    
+                    # Mostra risultati
+                    render_suggestions(suggestions)
 
 def main():
     st.title("🔍 Generatore Dati Strutturati SEO")
@@ -295,108 +970,33 @@ def main():
         if not api_key:
             st.warning("⚠️ Inserisci la tua API Key OpenAI per continuare")
             st.stop()
+        
+        # Modello OpenAI e gestione cache
+        model = st.selectbox(
+            "Modello OpenAI",
+            OPENAI_MODELS,
+            help="gpt-4o-mini è il più economico; i modelli più grandi sono più lenti e costosi"
+        )
+        ignore_cache = st.checkbox(
+            "Ignora cache",
+            help="Richiede nuove risposte a OpenAI anche per input già analizzati"
+        )
+        
+        if 'cache_bust' not in st.session_state:
+            st.session_state.cache_bust = 0
+        if st.button("🗑️ Svuota cache", help="Scarica di nuovo pagine e sitemap già analizzate"):
+            st.session_state.cache_bust += 1
+        bust = st.session_state.cache_bust
     
     # Inizializza le classi
-    scraper = WebScraper()
     schema_analyzer = SchemaOrgAnalyzer()
-    generator = StructuredDataGenerator(api_key)
+    generator = StructuredDataGenerator(api_key, model=model)
     
     # Tab principale
     tab1, tab2 = st.tabs(["📊 Analisi e Suggerimenti", "🛠️ Generazione Dati Strutturati"])
     
     with tab1:
-        st.header("Analisi Sito e Suggerimenti")
-        st.markdown("Analizza il tuo sito per ricevere suggerimenti sui migliori dati strutturati da implementare.")
-        
-        # Input methods
-        input_method = st.radio(
-            "Scegli il metodo di analisi:",
-            ["Sitemap XML", "URL Specifici", "Codice Sorgente"]
-        )
-        
-        if input_method == "Sitemap XML":
-            sitemap_url = st.text_input("URL della Sitemap", placeholder="https://esempio.com/sitemap.xml")
-            
-            if st.button("Analizza Sitemap", type="primary"):
-                if sitemap_url:
-                    with st.spinner("Analizzando la sitemap..."):
-                        urls = scraper.scrape_sitemap(sitemap_url)
-                        
-                        if urls:
-                            st.success(f"Trovati {len(urls)} URL nella sitemap")
-                            
-                            # Analizza le prime pagine
-                            pages_info = []
-                            progress_bar = st.progress(0)
-                            
-                            for i, url in enumerate(urls[:10]):  # Analizza max 10 pagine
-                                page_info = scraper.scrape_page(url)
-                                pages_info.append(page_info)
-                                progress_bar.progress((i + 1) / min(10, len(urls)))
-                                time.sleep(0.5)  # Rate limiting
-                            
-                            # Genera suggerimenti
-                            with st.spinner("Generando suggerimenti..."):
-                                suggestions = generator.suggest_structured_data(pages_info)
-                            
-                            # Mostra risultati
-                            if suggestions.get('suggestions'):
-                                st.subheader("📋 Suggerimenti Dati Strutturati")
-                                
-                                for suggestion in suggestions['suggestions']:
-                                    priority_color = {
-                                        'high': '🔴',
-                                        'medium': '🟡', 
-                                        'low': '🟢'
-                                    }.get(suggestion.get('priority', 'medium'), '🟡')
-                                    
-                                    with st.expander(f"{priority_color} {suggestion['schema_type']} - Priorità: {suggestion.get('priority', 'medium')}"):
-                                        st.write(f"**Motivo:** {suggestion['reason']}")
-                                        if suggestion.get('pages'):
-                                            st.write("**Pagine coinvolte:**")
-                                            for page_url in suggestion['pages']:
-                                                st.write(f"- {page_url}")
-        
-        elif input_method == "URL Specifici":
-            urls_input = st.text_area(
-                "Inserisci gli URL da analizzare (uno per riga)",
-                placeholder="https://esempio.com/prodotto1\nhttps://esempio.com/articolo1"
-            )
-            
-            if st.button("Analizza URL", type="primary"):
-                if urls_input:
-                    urls = [url.strip() for url in urls_input.split('\n') if url.strip()]
-                    
-                    with st.spinner("Analizzando le pagine..."):
-                        pages_info = []
-                        progress_bar = st.progress(0)
-                        
-                        for i, url in enumerate(urls):
-                            page_info = scraper.scrape_page(url)
-                            pages_info.append(page_info)
-                            progress_bar.progress((i + 1) / len(urls))
-                            time.sleep(0.5)
-                        
-                        # Genera suggerimenti
-                        suggestions = generator.suggest_structured_data(pages_info)
-                        
-                        # Mostra risultati (come sopra)
-                        if suggestions.get('suggestions'):
-                            st.subheader("📋 Suggerimenti Dati Strutturati")
-                            
-                            for suggestion in suggestions['suggestions']:
-                                priority_color = {
-                                    'high': '🔴',
-                                    'medium': '🟡', 
-                                    'low': '🟢'
-                                }.get(suggestion.get('priority', 'medium'), '🟡')
-                                
-                                with st.expander(f"{priority_color} {suggestion['schema_type']} - Priorità: {suggestion.get('priority', 'medium')}"):
-                                    st.write(f"**Motivo:** {suggestion['reason']}")
-                                    if suggestion.get('pages'):
-                                        st.write("**Pagine coinvolte:**")
-                                        for page_url in suggestion['pages']:
-                                            st.write(f"- {page_url}")
+        analysis_section(generator, ignore_cache, bust)
     
     with tab2:
         st.header("Generazione Dati Strutturati")
@@ -432,14 +1032,17 @@ def main():
             if st.button("Genera Dati Strutturati", type="primary"):
                 if target_url and (custom_schema or schema_option != "Altro"):
                     with st.spinner("Analizzando la pagina..."):
-                        page_info = scraper.scrape_page(target_url)
+                        page_info = cached_page(target_url, bust)
                     
                     if 'error' not in page_info:
                         with st.spinner("Generando dati strutturati..."):
-                            structured_data = generator.generate_structured_data(
+                            structured_data = get_structured_data(
+                                generator,
                                 page_info, 
                                 schema_option if schema_option != "Altro" else custom_schema,
-                                custom_schema if schema_option == "Altro" else None
+                                custom_schema if schema_option == "Altro" else None,
+                                force=ignore_cache,
+                                bust=bust
                             )
                         
                         if structured_data:
@@ -492,7 +1095,7 @@ def main():
                 if source_code and (custom_schema or schema_option != "Altro"):
                     with st.spinner("Analizzando il codice sorgente..."):
                         # Parse del codice sorgente
-                        soup = BeautifulSoup(source_code, 'html.parser')
+                        soup = BeautifulSoup(source_code, HTML_PARSER, parse_only=PAGE_STRAINER)
                         
                         page_info = {
                             'url': target_url_manual or 'https://esempio.com',
@@ -509,19 +1112,16 @@ def main():
                             page_info['meta_description'] = meta_desc.get('content', '')
                         
                         # Estrai headings
-                        for i in range(1, 7):
-                            headings = soup.find_all(f'h{i}')
-                            for h in headings[:3]:
-                                page_info['headings'].append({
-                                    'level': i,
-                                    'text': h.get_text().strip()
-                                })
+                        page_info['headings'] = WebScraper.extract_headings(soup, per_level=3)
                     
                     with st.spinner("Generando dati strutturati..."):
-                        structured_data = generator.generate_structured_data(
+                        structured_data = get_structured_data(
+                            generator,
                             page_info,
                             schema_option if schema_option != "Altro" else custom_schema,
-                            custom_schema if schema_option == "Altro" else None
+                            custom_schema if schema_option == "Altro" else None,
+                            force=ignore_cache,
+                            bust=bust
                         )
                     
                     if structured_data: